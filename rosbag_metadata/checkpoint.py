@@ -0,0 +1,100 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Hordur K. Heidarsson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import json
+
+import yaml
+
+from .utils import byteify
+
+class BagInfoCheckpoint(object):
+    """Bag info collected so far, one json line per inspected bag.
+
+    Only the file identity and the offset of the latest line for each bag
+    are kept in memory. The info itself is read back from the file one bag
+    at a time when the metadata is written.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        if os.path.exists(filename):
+            self._load()
+
+    def _load(self):
+        with open(self.filename, 'r+') as f:
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Interrupted while writing, drop the partial line
+                    f.seek(offset)
+                    f.truncate()
+                    break
+                self.entries[record['bag'].encode('utf-8')] = (record['identity'], offset, record.get('checksum'))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def is_done(self, name, identity, checksum=None):
+        entry = self.entries.get(name)
+        return entry is not None and entry[0] == identity and entry[2] == checksum
+
+    def append(self, name, identity, info, checksum=None):
+        line = json.dumps({'bag': name, 'identity': identity, 'info': info, 'checksum': checksum}, default=str) + '\n'
+        with open(self.filename, 'a') as f:
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries[name] = (identity, offset, checksum)
+
+    def keep(self, names):
+        """Forget bags that are no longer present."""
+        names = set(names)
+        for name in self.entries.keys():
+            if name not in names:
+                del self.entries[name]
+
+    def items(self):
+        if not self.entries:
+            return
+        with open(self.filename, 'r') as f:
+            for name in sorted(self.entries.keys()):
+                f.seek(self.entries[name][1])
+                yield (name, byteify(json.loads(f.readline())['info']))
+
+    def to_yaml(self, indent='  '):
+        """Yields the bags as yaml mapping entries, one bag at a time."""
+        for name, info in self.items():
+            for line in yaml.dump({name: info}).splitlines(True):
+                yield indent + line
+
+    def remove(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        self.entries = {}
@@ -0,0 +1,133 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Hordur K. Heidarsson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import io
+import hashlib
+import threading
+
+import yaml
+
+from .config import *
+
+def file_identity(path):
+    """Identity of a file on disk, used to decide whether a cached checksum
+    is still valid. A change in size, mtime or inode invalidates it."""
+    st = os.stat(path)
+    return [st.st_dev, st.st_ino, st.st_size, int(st.st_mtime * 1e6)]
+
+def _hash_range(h, f, buf, length):
+    # Stream up to length bytes from f into h through a reusable buffer.
+    # hashlib releases the GIL for large updates, so this parallelises well
+    # across threads.
+    view = memoryview(buf)
+    while length > 0:
+        n = f.readinto(view[:min(length, len(buf))])
+        if not n:
+            break
+        h.update(view[:n])
+        length -= n
+
+def fingerprint(path, algorithm=CHECKSUM_ALGORITHM, block_size=FINGERPRINT_BLOCK_SIZE):
+    """Fast change-detection hash over file size, the first and the last
+    block_size bytes. Not a content hash."""
+    size = os.path.getsize(path)
+    h = hashlib.new(algorithm)
+    h.update(str(size).encode('ascii'))
+    buf = bytearray(block_size)
+    with io.open(path, 'rb') as f:
+        _hash_range(h, f, buf, block_size)
+        if size > block_size:
+            f.seek(max(block_size, size - block_size))
+            _hash_range(h, f, buf, block_size)
+    return h.hexdigest()
+
+def full_checksum(path, algorithm=CHECKSUM_ALGORITHM, block_size=CHECKSUM_BLOCK_SIZE):
+    h = hashlib.new(algorithm)
+    buf = bytearray(block_size)
+    with io.open(path, 'rb', buffering=0) as f:
+        _hash_range(h, f, buf, os.fstat(f.fileno()).st_size)
+    return h.hexdigest()
+
+
+class ChecksumCache(object):
+    """Checksums of the bags in one directory, keyed on file name and
+    invalidated by file identity. Stored as yaml next to the bags."""
+    def __init__(self, dirname, filename=CHECKSUM_CACHE_FILENAME):
+        self.filename = os.path.join(dirname, filename)
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.entries = {}
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename, 'r') as f:
+                    self.entries = yaml.safe_load(f) or {}
+            except (IOError, yaml.YAMLError):
+                self.entries = {}
+
+    def get(self, name, identity, key):
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None or entry.get('identity') != identity:
+                return None
+            return entry.get(key)
+
+    def set(self, name, identity, key, value):
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None or entry.get('identity') != identity:
+                entry = {'identity': identity}
+                self.entries[name] = entry
+            entry[key] = value
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            # Hashing threads may still be running after an interrupt
+            with self.lock:
+                with open(self.filename, 'w') as f:
+                    yaml.safe_dump(self.entries, f)
+                self.dirty = False
+        except IOError:
+            pass # Read-only archive, caching is best effort
+
+
+def get_checksum(path, mode='full', algorithm=CHECKSUM_ALGORITHM, cache=None):
+    name = os.path.basename(path)
+    identity = file_identity(path)
+    res = {'algorithm': algorithm}
+    keys = ['fingerprint']
+    if mode == 'full':
+        keys.append('digest')
+    for key in keys:
+        value = cache.get(name, identity, key) if cache is not None else None
+        if value is None:
+            if key == 'fingerprint':
+                value = fingerprint(path, algorithm=algorithm)
+            else:
+                value = full_checksum(path, algorithm=algorithm)
+            if cache is not None:
+                cache.set(name, identity, key, value)
+        res[key] = value
+    return res
@@ -36,3 +36,29 @@ DEFAULT_FIELDS = ('description',)
 
 METADATA_FILENAME = 'metadata.yaml'
 DEFAULT_TOPIC = '/metadata'
+
+CHECKSUM_CACHE_FILENAME = '.metadata_checksums.yaml'
+CHECKSUM_ALGORITHM = 'sha256'
+CHECKSUM_MODES = ('none', 'fingerprint', 'full')
+CHECKSUM_BLOCK_SIZE = 8 * 1024 * 1024
+FINGERPRINT_BLOCK_SIZE = 1024 * 1024
+
+JOURNAL_SUFFIX = '.journal'
+JOURNAL_COMPACT_SIZE = 1024 * 1024
+
+INDEX_LEASE_TIME = 300
+INDEX_POLL_INTERVAL = 5
+INDEX_CATALOG_FILENAME = 'catalog.yaml'
+
+SERVE_HOST = '127.0.0.1'
+SERVE_ALLOWED_HOSTS = ('localhost', '127.0.0.1', '::1')
+SERVE_PORT = 8765
+SERVE_THREADS = 8
+SERVE_CACHE_SIZE = 1024
+
+INSPECT_CACHE_SIZE = 256
+INSPECT_POLL_INTERVAL = 0.2
+
+BAGS_CHECKPOINT_FILENAME = '.metadata_bags.checkpoint'
+
+TIME_INDEX_FILENAME = '.metadata_time_index.json'
@@ -0,0 +1,166 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Hordur K. Heidarsson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import print_function
+
+import os
+import hashlib
+import argparse
+
+import yaml
+
+from .config import *
+
+# Fields that differ on every write
+DIFF_IGNORE_FIELDS = (METADATA_INFO_FIELD,)
+
+# Marks a value that only exists on one side of a diff
+MISSING = object()
+
+
+def hash_tree(data):
+    """Returns (digest, children) for data, where children mirrors the
+    dicts and lists in data and digest covers the whole subtree. Equal
+    subtrees have equal digests, so diffs never need to descend into them."""
+    if isinstance(data, dict):
+        children = dict((k, hash_tree(v)) for k, v in data.items())
+        h = hashlib.sha1(b'd')
+        for k in sorted(children.keys()):
+            h.update(hash_tree(k)[0])
+            h.update(children[k][0])
+        return (h.digest(), children)
+    if isinstance(data, (list, tuple)):
+        children = [hash_tree(v) for v in data]
+        h = hashlib.sha1(b'l')
+        for c in children:
+            h.update(c[0])
+        return (h.digest(), children)
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    elif isinstance(data, (int, long)) and not isinstance(data, bool):
+        # 1 and 1L are equal but repr differently
+        return (hashlib.sha1(b'i%d' % data).digest(), None)
+    return (hashlib.sha1(b'v%r' % (data,)).digest(), None)
+
+def diff_trees(a, a_tree, b, b_tree, path=()):
+    """Yields (path, old, new) for each changed subtree. Missing values are
+    reported as the MISSING marker."""
+    if a_tree[0] == b_tree[0]:
+        return
+    if isinstance(a, dict) and isinstance(b, dict):
+        for k in sorted(set(a.keys()) | set(b.keys())):
+            if k not in b:
+                yield (path + (k,), a[k], MISSING)
+            elif k not in a:
+                yield (path + (k,), MISSING, b[k])
+            else:
+                for d in diff_trees(a[k], a_tree[1][k], b[k], b_tree[1][k], path + (k,)):
+                    yield d
+    elif isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        for i in range(max(len(a), len(b))):
+            if i >= len(b):
+                yield (path + (i,), a[i], MISSING)
+            elif i >= len(a):
+                yield (path + (i,), MISSING, b[i])
+            else:
+                for d in diff_trees(a[i], a_tree[1][i], b[i], b_tree[1][i], path + (i,)):
+                    yield d
+    else:
+        yield (path, a, b)
+
+def format_path(path):
+    res = ''
+    for p in path:
+        if isinstance(p, int):
+            res += '[%d]' % p
+        else:
+            res += ('.%s' if res else '%s') % p
+    return res or '.'
+
+def format_value(v):
+    if isinstance(v, (dict, list, tuple)):
+        return yaml.safe_dump(v, default_flow_style=True, width=float('inf')).strip()
+    return '%s' % (v,)
+
+def select(data, path):
+    """Returns the subtree at a dotted path, or MISSING."""
+    for k in path.split('.') if path else []:
+        if not isinstance(data, dict) or k not in data:
+            return MISSING
+        data = data[k]
+    return data
+
+
+def load_document(bmu, path, ignore_fields=DIFF_IGNORE_FIELDS):
+    found = bmu.extract(os.path.abspath(os.path.expanduser(path)))
+    if len(found) == 0:
+        return None
+    source, data = found[0]
+    if isinstance(data, dict):
+        data = dict((k, v) for k, v in data.items() if k not in ignore_fields)
+    return (source, data)
+
+def print_diff(differences):
+    for path, old, new in differences:
+        if old is MISSING:
+            print('+ %s: %s' % (format_path(path), format_value(new)))
+        elif new is MISSING:
+            print('- %s: %s' % (format_path(path), format_value(old)))
+        else:
+            print('~ %s: %s -> %s' % (format_path(path), format_value(old), format_value(new)))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='rosbag_metadata diff', description='Show which fields differ between the metadata of a baseline and one or more targets.')
+    parser.add_argument('baseline', type=str, help='Baseline (bagfile, yamlfile or directory)')
+    parser.add_argument('targets', nargs='+', type=str, help='Targets to compare against the baseline')
+    parser.add_argument('-f', '--field', dest='field', type=str, help='Only compare the field at this dotted path, e.g. _system_info.ros')
+    parser.add_argument('--include-metadata-info', dest='ignore', action='store_const', const=(), default=DIFF_IGNORE_FIELDS, help='Also compare %s' % METADATA_INFO_FIELD)
+    args = parser.parse_args(argv)
+
+    # Imported here so the tree functions can be used without ROS
+    from .metadata_writer import BagMetadataUtility
+    bmu = BagMetadataUtility(args.baseline)
+    baseline = load_document(bmu, args.baseline, ignore_fields=args.ignore)
+    if baseline is None:
+        print('No metadata found in %s' % args.baseline)
+        return 2
+
+    # The baseline tree is hashed once and reused for every target
+    a = select(baseline[1], args.field)
+    a_tree = hash_tree(a)
+    differ = False
+    for target in args.targets:
+        found = load_document(bmu, target, ignore_fields=args.ignore)
+        if found is None:
+            print('No metadata found in %s' % target)
+            differ = True
+            continue
+        b = select(found[1], args.field)
+        differences = list(diff_trees(a, a_tree, b, hash_tree(b), ()))
+        print('--- %s\n+++ %s' % (baseline[0], found[0]))
+        if differences:
+            print_diff(differences)
+            differ = True
+        else:
+            print('No differences')
+    return 1 if differ else 0
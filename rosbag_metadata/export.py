@@ -0,0 +1,263 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Hordur K. Heidarsson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import print_function
+
+import os
+import sys
+import csv
+import argparse
+import collections
+from multiprocessing.pool import ThreadPool
+
+import yaml
+
+from .config import *
+from .utils import *
+from .metadata_writer import BagMetadataUtility
+
+# Tables written by export. Every table has a fixed schema so rows can be
+# streamed out in batches. User fields vary between documents, so they are
+# exported in long format (one row per field) instead of one column each.
+TABLES = (
+    ('metadata', (('source', 'string'), ('field', 'string'), ('value', 'string'))),
+    ('bags', (('path', 'string'), ('bag', 'string'), ('version', 'string'),
+        ('start', 'float64'), ('end', 'float64'), ('duration', 'float64'),
+        ('size', 'int64'), ('messages', 'int64'), ('compression', 'string'),
+        ('indexed', 'bool_'), ('checksum', 'string'))),
+    ('topics', (('path', 'string'), ('topic', 'string'), ('type', 'string'),
+        ('messages', 'int64'), ('connections', 'int64'), ('frequency', 'float64'))),
+)
+
+EXPORT_FORMATS = ('parquet', 'arrow', 'csv')
+EXPORT_BATCH_SIZE = 10000
+
+
+def _to_string(v):
+    if v is None or isinstance(v, basestring):
+        return v
+    if isinstance(v, (list, tuple, dict)):
+        return yaml.safe_dump(v, default_flow_style=True).strip()
+    return '%s' % v
+
+def _convert(v, type_name):
+    if v is None:
+        return None
+    try:
+        if type_name == 'string':
+            return _to_string(v)
+        if type_name == 'float64':
+            return float(v)
+        if type_name == 'int64':
+            return int(v)
+        if type_name == 'bool_':
+            return bool(v)
+    except (TypeError, ValueError):
+        return None
+    return v
+
+
+class CsvTableWriter(object):
+    def __init__(self, filename, columns, batch_size=EXPORT_BATCH_SIZE):
+        self.columns = columns
+        self.f = open(filename, 'wb')
+        self.writer = csv.writer(self.f)
+        self.writer.writerow([c[0] for c in columns])
+
+    def write(self, row):
+        values = []
+        for name, type_name in self.columns:
+            v = _convert(row.get(name), type_name)
+            if isinstance(v, unicode):
+                v = v.encode('utf-8')
+            values.append(v)
+        self.writer.writerow(values)
+
+    def close(self):
+        self.f.close()
+
+
+class ArrowTableWriter(object):
+    """Buffers up to batch_size rows and writes them out as one record
+    batch, either to a parquet file or an arrow IPC file."""
+    def __init__(self, filename, columns, batch_size=EXPORT_BATCH_SIZE, file_format='parquet'):
+        try:
+            import pyarrow
+        except ImportError:
+            print("Exporting to %s requires pyarrow (pip install pyarrow)." % file_format)
+            exit(1)
+        self.pa = pyarrow
+        self.columns = columns
+        self.batch_size = batch_size
+        self.schema = pyarrow.schema([(name, getattr(pyarrow, type_name)()) for name, type_name in columns])
+        self.batch = dict((name, []) for name, type_name in columns)
+        self.rows = 0
+        if file_format == 'parquet':
+            import pyarrow.parquet
+            self.writer = pyarrow.parquet.ParquetWriter(filename, self.schema)
+            self.write_batch = lambda b: self.writer.write_table(self.pa.Table.from_batches([b]))
+        else:
+            self.sink = pyarrow.OSFile(filename, 'wb')
+            self.writer = pyarrow.RecordBatchFileWriter(self.sink, self.schema)
+            self.write_batch = self.writer.write_batch
+
+    def write(self, row):
+        for name, type_name in self.columns:
+            self.batch[name].append(_convert(row.get(name), type_name))
+        self.rows += 1
+        if self.rows >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows == 0:
+            return
+        arrays = [self.pa.array(self.batch[name], type=self.schema.field(i).type) for i, (name, type_name) in enumerate(self.columns)]
+        self.write_batch(self.pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        for name in self.batch:
+            self.batch[name] = []
+        self.rows = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        if hasattr(self, 'sink'):
+            self.sink.close()
+
+
+def open_table_writers(output, file_format, batch_size=EXPORT_BATCH_SIZE):
+    if not os.path.exists(output):
+        os.makedirs(output)
+    writers = {}
+    for name, columns in TABLES:
+        filename = os.path.join(output, '%s.%s' % (name, file_format))
+        if file_format == 'csv':
+            writers[name] = CsvTableWriter(filename, columns, batch_size=batch_size)
+        else:
+            writers[name] = ArrowTableWriter(filename, columns, batch_size=batch_size, file_format=file_format)
+    return writers
+
+
+def find_bag_dirs(root):
+    """Yields directories below root containing bags or a metadata file."""
+    if not os.path.isdir(root):
+        yield os.path.dirname(root)
+        return
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for f in filenames:
+            if f.endswith('.bag') or f == METADATA_FILENAME:
+                yield dirpath
+                break
+
+def export_rows(bmu, dirname, bagname=None):
+    """Collects the rows for all tables from one directory, or only for the
+    bag bagname in it. Bag summaries already stored in the metadata file are
+    used instead of opening bags."""
+    rows = dict((name, []) for name, columns in TABLES)
+
+    try:
+        if bagname is None:
+            found = bmu.extract(dirname)
+        else:
+            found = (bmu.extract(os.path.join(dirname, bagname)) or
+                     bmu.extract_from_dir(dirname, search_bags=False))
+    except Exception as e:
+        print('Could not read metadata in %s: %s' % (dirname, e), file=sys.stderr)
+        found = []
+    stored_bags = {}
+    for source, data in found:
+        if not isinstance(data, dict):
+            continue
+        stored_bags = data.get(BAGS_INFO_FIELD) or stored_bags
+        fields = dict((k, v) for k, v in data.items() if k not in SYSTEM_FIELDS)
+        for k, v in sorted(flatten_dict(fields).items()):
+            rows['metadata'].append({'source': source, 'field': k, 'value': v})
+
+    for f in [bagname] if bagname is not None else sorted(os.listdir(dirname)):
+        if not f.endswith('.bag'):
+            continue
+        path = os.path.join(dirname, f)
+        info = stored_bags.get(f)
+        if info is None:
+            try:
+                info = bmu.get_info(path)
+            except Exception as e:
+                print('Could not read %s: %s' % (path, e), file=sys.stderr)
+                continue
+        bag = dict(info)
+        bag['path'] = path
+        bag['bag'] = f
+        if isinstance(info.get('checksum'), dict):
+            bag['checksum'] = info['checksum'].get('digest') or info['checksum'].get('fingerprint')
+        rows['bags'].append(bag)
+        for t in info.get('topics') or []:
+            topic = dict(t)
+            topic['path'] = path
+            rows['topics'].append(topic)
+    return rows
+
+def export(root, output, file_format='parquet', jobs=None, batch_size=EXPORT_BATCH_SIZE):
+    bmu = BagMetadataUtility(root)
+    writers = open_table_writers(output, file_format, batch_size=batch_size)
+    if os.path.isdir(root):
+        tasks = ((d, None) for d in find_bag_dirs(root))
+    else:
+        tasks = [os.path.split(root)]
+
+    def write(rows):
+        for name, table_rows in rows.items():
+            for r in table_rows:
+                writers[name].write(r)
+
+    pool = ThreadPool(jobs or 1)
+    window = 2 * (jobs or 1)
+    pending = collections.deque()
+    try:
+        # Directories are only submitted while fewer than window are queued
+        # or waiting to be written, so memory stays bounded. Results are
+        # written in directory order.
+        for task in tasks:
+            pending.append(pool.apply_async(export_rows, (bmu, ) + tuple(task)))
+            if len(pending) >= window:
+                write(pending.popleft().get())
+        while pending:
+            write(pending.popleft().get())
+    finally:
+        pool.close()
+        pool.join()
+        for w in writers.values():
+            w.close()
+    return [os.path.join(output, '%s.%s' % (name, file_format)) for name, columns in TABLES]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='rosbag_metadata export', description='Export metadata and bag summaries found below a directory as tables.')
+    parser.add_argument('path', metavar='path', type=str, help='Root directory (or bagfile) to export')
+    parser.add_argument('-f', '--format', dest='format', choices=EXPORT_FORMATS, default='parquet', help='Output format (parquet and arrow require pyarrow)')
+    parser.add_argument('-o', '--output', dest='output', type=str, default='.', help='Output directory for metadata, bags and topics tables')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, help='Number of directories to process in parallel')
+    parser.add_argument('--batch-size', dest='batch_size', type=int, default=EXPORT_BATCH_SIZE, help='Rows per written batch')
+    args = parser.parse_args(argv)
+
+    root = os.path.abspath(os.path.expanduser(args.path))
+    for f in export(root, os.path.expanduser(args.output), file_format=args.format, jobs=args.jobs, batch_size=args.batch_size):
+        print('Wrote %s' % f)
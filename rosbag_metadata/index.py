@@ -0,0 +1,287 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Hordur K. Heidarsson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Distributed indexing through a work queue kept in a shared directory.
+#
+# The queue directory holds:
+#   tasks/<id>        one file per shard, containing the shard directory
+#   leases/<id>/<n>   lease generations; the highest generation is current
+#   results/<id>      yaml result of a finished shard
+#   done/<id>         marks a shard as finished
+#
+# A worker claims a shard by creating the next lease generation with O_EXCL,
+# which only one worker can win, even over NFS. The current lease is kept
+# alive by touching it. A lease that has not been touched within the lease
+# time is expired and its shard can be claimed again. Times are compared
+# against the mtime of a freshly touched file in the queue directory, so
+# workers on different machines do not need synchronized clocks.
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import uuid
+import errno
+import socket
+import hashlib
+import argparse
+import threading
+
+import yaml
+
+from .config import *
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+def _write_atomic(filename, data):
+    tmp = '%s.%s.tmp' % (filename, uuid.uuid4().hex)
+    with open(tmp, 'w') as f:
+        f.write(data)
+    os.rename(tmp, filename)
+
+
+class WorkQueue(object):
+    def __init__(self, path, lease_time=INDEX_LEASE_TIME):
+        self.path = path
+        self.lease_time = lease_time
+        self.worker_id = '%s:%d:%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        for d in ('tasks', 'leases', 'results', 'done'):
+            _makedirs(os.path.join(path, d))
+
+    def _dir(self, kind, task_id=''):
+        return os.path.join(self.path, kind, task_id)
+
+    def now(self):
+        clock = os.path.join(self.path, 'clock')
+        with open(clock, 'a'):
+            os.utime(clock, None)
+        return os.stat(clock).st_mtime
+
+    def add(self, shard):
+        if isinstance(shard, unicode):
+            shard = shard.encode('utf-8')
+        task_id = hashlib.sha1(shard).hexdigest()[:16]
+        filename = self._dir('tasks', task_id)
+        if not os.path.exists(filename):
+            _write_atomic(filename, shard)
+        return task_id
+
+    def tasks(self):
+        return sorted(f for f in os.listdir(self._dir('tasks')) if not f.endswith('.tmp'))
+
+    def done(self):
+        return set(os.listdir(self._dir('done')))
+
+    def shard(self, task_id):
+        with open(self._dir('tasks', task_id), 'r') as f:
+            return f.read()
+
+    def _lease(self, task_id, gen):
+        return os.path.join(self._dir('leases', task_id), str(gen))
+
+    def current_lease(self, task_id):
+        try:
+            generations = [int(g) for g in os.listdir(self._dir('leases', task_id))]
+        except OSError:
+            return None
+        return max(generations) if generations else None
+
+    def claim(self, task_id, now=None):
+        """Tries to take the lease on a task. Returns the lease filename or
+        None if the task is leased by a live worker or someone else won."""
+        gen = self.current_lease(task_id)
+        if gen is not None:
+            try:
+                mtime = os.stat(self._lease(task_id, gen)).st_mtime
+            except OSError:
+                return None
+            if (now or self.now()) - mtime < self.lease_time:
+                return None
+            gen += 1
+        else:
+            gen = 0
+            _makedirs(self._dir('leases', task_id))
+
+        lease = self._lease(task_id, gen)
+        try:
+            fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as e:
+            if e.errno == errno.EEXIST:
+                return None
+            raise
+        os.write(fd, self.worker_id.encode('utf-8'))
+        os.close(fd)
+        return lease
+
+    def claim_next(self):
+        """Returns (task_id, lease) for the next claimable task, (None, None)
+        if all tasks are leased, or None if every task is done."""
+        done = self.done()
+        pending = [t for t in self.tasks() if t not in done]
+        if not pending:
+            return None
+        now = self.now()
+        for task_id in pending:
+            lease = self.claim(task_id, now=now)
+            if lease is not None:
+                return (task_id, lease)
+        return (None, None)
+
+    def finish(self, task_id, result):
+        _write_atomic(self._dir('results', task_id), yaml.dump(result))
+        with open(self._dir('done', task_id), 'w') as f:
+            f.write(self.worker_id)
+
+    def results(self):
+        for task_id in sorted(self.done()):
+            filename = self._dir('results', task_id)
+            if os.path.exists(filename):
+                with open(filename, 'r') as f:
+                    yield yaml.load(f.read())
+
+
+class LeaseKeeper(threading.Thread):
+    """Touches a lease file until stopped."""
+    def __init__(self, lease, interval):
+        super(LeaseKeeper, self).__init__()
+        self.daemon = True
+        self.lease = lease
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                os.utime(self.lease, None)
+            except OSError:
+                pass
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def index_shard(bmu, dirname):
+    res = {'path': dirname, 'bags': {}}
+    try:
+        found = bmu.extract(dirname)
+        if len(found) > 0:
+            res['source'], res['metadata'] = found[0]
+    except Exception as e:
+        res['error'] = '%s' % e
+    for f in sorted(os.listdir(dirname)):
+        if f.endswith('.bag'):
+            try:
+                res['bags'][f] = bmu.get_info(os.path.join(dirname, f))
+            except Exception as e:
+                res['bags'][f] = {'error': '%s' % e}
+    return res
+
+def work(queue, poll_interval=INDEX_POLL_INTERVAL, wait=True):
+    # Imported here so the queue itself can be used without ROS
+    from .metadata_writer import BagMetadataUtility
+    bmu = BagMetadataUtility(queue.path)
+    count = 0
+    while True:
+        claimed = queue.claim_next()
+        if claimed is None:
+            break
+        task_id, lease = claimed
+        if task_id is None:
+            if not wait:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        keeper = LeaseKeeper(lease, queue.lease_time / 3.0)
+        keeper.start()
+        try:
+            shard = queue.shard(task_id)
+            try:
+                result = index_shard(bmu, shard)
+            except Exception as e:
+                # Record the failure, otherwise every worker that reclaims
+                # the shard would fail on it the same way
+                print('Could not index %s: %s' % (shard, e), file=sys.stderr)
+                result = {'path': shard, 'error': '%s' % e}
+            queue.finish(task_id, result)
+        finally:
+            keeper.stop()
+        count += 1
+    return count
+
+def merge(queue, output):
+    """Writes all results to one catalog, one shard at a time."""
+    with open(output, 'w') as f:
+        for r in queue.results():
+            f.write(yaml.dump({r['path']: r}))
+    return output
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='rosbag_metadata index', description='Index bag directories with several workers sharing a work queue directory.')
+    parser.add_argument('--lease-time', dest='lease_time', type=float, default=INDEX_LEASE_TIME, help='Seconds before the shard of an unresponsive worker is handed out again')
+    subparsers = parser.add_subparsers(dest='action')
+
+    p = subparsers.add_parser('init', help='Add shards below the given roots to the queue')
+    p.add_argument('queue', type=str, help='Queue directory')
+    p.add_argument('roots', nargs='+', type=str, help='Directories to index')
+
+    p = subparsers.add_parser('work', help='Process shards until the queue is done')
+    p.add_argument('queue', type=str, help='Queue directory')
+    p.add_argument('--no-wait', dest='wait', action='store_false', help='Exit when no shard can be claimed instead of waiting for other workers')
+    p.add_argument('--poll-interval', dest='poll_interval', type=float, default=INDEX_POLL_INTERVAL)
+
+    p = subparsers.add_parser('status', help='Show queue progress')
+    p.add_argument('queue', type=str, help='Queue directory')
+
+    p = subparsers.add_parser('merge', help='Merge results into one catalog')
+    p.add_argument('queue', type=str, help='Queue directory')
+    p.add_argument('-o', '--output', dest='output', type=str, help='Catalog file (default: %s in the queue directory)' % INDEX_CATALOG_FILENAME)
+
+    args = parser.parse_args(argv)
+    queue = WorkQueue(os.path.abspath(os.path.expanduser(args.queue)), lease_time=args.lease_time)
+
+    if args.action == 'init':
+        from .export import find_bag_dirs
+        n = 0
+        for root in args.roots:
+            for d in find_bag_dirs(os.path.abspath(os.path.expanduser(root))):
+                queue.add(d)
+                n += 1
+        print('Added %d shards to %s' % (n, queue.path))
+    elif args.action == 'work':
+        n = work(queue, poll_interval=args.poll_interval, wait=args.wait)
+        print('%s processed %d shards' % (queue.worker_id, n))
+    elif args.action == 'status':
+        tasks = queue.tasks()
+        done = queue.done()
+        print('%d of %d shards done' % (len(done), len(tasks)))
+    elif args.action == 'merge':
+        output = args.output or os.path.join(queue.path, INDEX_CATALOG_FILENAME)
+        print('Wrote %s' % merge(queue, os.path.expanduser(output)))
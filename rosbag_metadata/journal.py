@@ -0,0 +1,162 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Hordur K. Heidarsson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Append-only journal for metadata files.
+#
+# Next to metadata.yaml lives metadata.yaml.journal. Every write appends one
+# json line holding the top level keys that were set or removed. Readers load
+# the yaml file and fold the journal into it. Compaction writes the folded
+# state back to the yaml file and truncates the journal. All access to the
+# journal is serialized with flock on the journal file itself, so several
+# writers can safely share one metadata file.
+
+from __future__ import print_function
+
+import os
+import json
+import fcntl
+import argparse
+import contextlib
+
+import yaml
+
+from .config import *
+from .utils import byteify
+
+def journal_filename(filename):
+    return filename + JOURNAL_SUFFIX
+
+def has_journal(filename):
+    return os.path.exists(journal_filename(filename))
+
+@contextlib.contextmanager
+def locked_journal(filename, exclusive=True):
+    with open(journal_filename(filename), 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield f
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def read_records(f):
+    f.seek(0)
+    res = []
+    for line in f:
+        try:
+            res.append(byteify(json.loads(line)))
+        except ValueError:
+            continue # Torn write, later appends start on a new line
+    return res
+
+def apply_record(data, record):
+    data.update(record.get('set') or {})
+    for k in record.get('unset') or []:
+        data.pop(k, None)
+    return data
+
+def _load(filename, f):
+    data = {}
+    if os.path.exists(filename):
+        with open(filename, 'r') as base:
+            data = yaml.load(base.read()) or {}
+    for record in read_records(f):
+        apply_record(data, record)
+    return data
+
+def load(filename):
+    """Returns the current state of a journaled metadata file, or None if
+    neither the file nor its journal exist."""
+    if not has_journal(filename):
+        if not os.path.exists(filename):
+            return None
+        with open(filename, 'r') as f:
+            return yaml.load(f.read())
+    with locked_journal(filename, exclusive=False) as f:
+        return _load(filename, f)
+
+def append(filename, set_fields=None, unset_fields=None, compact_size=JOURNAL_COMPACT_SIZE):
+    record = {}
+    if set_fields:
+        record['set'] = set_fields
+    if unset_fields:
+        record['unset'] = list(unset_fields)
+    if not record:
+        return None
+    line = json.dumps(record, sort_keys=True, default=str) + '\n'
+    with locked_journal(filename) as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            # Do not glue this record onto the end of a torn write
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != '\n':
+                line = '\n' + line
+            f.seek(0, os.SEEK_END)
+        f.write(line)
+        f.flush()
+        if compact_size is not None and f.tell() > compact_size:
+            _compact(filename, f)
+    return (journal_filename(filename), )
+
+def _compact(filename, f):
+    data = _load(filename, f)
+    tmp = '%s.%d.tmp' % (filename, os.getpid())
+    with open(tmp, 'w') as out:
+        out.write(yaml.dump(data))
+        out.flush()
+        os.fsync(out.fileno())
+    os.rename(tmp, filename)
+    f.seek(0)
+    f.truncate()
+
+@contextlib.contextmanager
+def replacing(filename):
+    """Holds the journal lock while filename is rewritten from scratch, then
+    empties the journal so its records are not replayed on top of the new
+    contents. Does nothing if there is no journal."""
+    if not has_journal(filename):
+        yield
+        return
+    with locked_journal(filename) as f:
+        yield
+        f.seek(0)
+        f.truncate()
+
+def compact(filename):
+    with locked_journal(filename) as f:
+        _compact(filename, f)
+    return (filename, )
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='rosbag_metadata compact', description='Fold metadata journals into their metadata files.')
+    parser.add_argument('paths', metavar='path', nargs='+', type=str, help='Metadata file or directory')
+    args = parser.parse_args(argv)
+
+    for p in args.paths:
+        p = os.path.abspath(os.path.expanduser(p))
+        if os.path.isdir(p):
+            p = os.path.join(p, METADATA_FILENAME)
+        if not has_journal(p):
+            print('No journal found for %s' % p)
+            continue
+        compact(p)
+        print('Compacted %s' % p)
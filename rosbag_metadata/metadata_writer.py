@@ -26,11 +26,15 @@ import rospy
 
 import os.path
 import yaml
-import re
 import datetime
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 
 from .config import *
 from .utils import *
+from .checksum import get_checksum, ChecksumCache, file_identity
+from .checkpoint import BagInfoCheckpoint
+from . import journal
 
 class BagMetadataUtility(object):
     """docstring for BagMetadataUtility"""
@@ -39,6 +43,7 @@ class BagMetadataUtility(object):
         self.target = target
         self.metadata_filename = metadata_filename
         self.default_topic = default_topic
+        self.inspected = LRUCache(INSPECT_CACHE_SIZE)
 
     def is_bag_file(self, path):
         if path.endswith('.bag'): #assume it is a bagfile if it ends with .bag
@@ -49,22 +54,98 @@ class BagMetadataUtility(object):
 
         return False
 
-    def get_rosbag_info(self, path):
-        res = {}
+    def collect_rosbag_info(self, path, checksum=None, jobs=None):
+        """Inspects the bags in path, appending each result to a checkpoint
+        file next to the bags as soon as it is done. Bags already in the
+        checkpoint and unchanged since are skipped, so an interrupted run
+        continues where it stopped. Returns the checkpoint."""
         path = os.path.normpath(os.path.join(os.getcwd(), path))
         if not os.path.isdir(path):
             path = os.path.dirname(path)
-        for f in os.listdir(path):
-            if f.endswith('.bag'):
-                res[f] = self.get_info(os.path.join(path,f))
+        bags = sorted(f for f in os.listdir(path) if f.endswith('.bag'))
+
+        if checksum == 'none':
+            checksum = None
+        checkpoint = BagInfoCheckpoint(os.path.join(path, BAGS_CHECKPOINT_FILENAME))
+        checkpoint.keep(bags)
+        todo = [f for f in bags if not checkpoint.is_done(f, file_identity(os.path.join(path, f)), checksum)]
+
+        cache = ChecksumCache(path) if checksum else None
+        def work(f):
+            p = os.path.join(path, f)
+            identity = file_identity(p)
+            info = dict(self.inspect(p)['info'])
+            if cache is not None:
+                info['checksum'] = get_checksum(p, mode=checksum, cache=cache)
+            return (f, identity, info)
+
+        # Hashing releases the GIL, so bags are done in parallel by default
+        pool = ThreadPool(jobs or max(1, min(len(todo), 4)))
+        try:
+            results = pool.imap_unordered(work, todo)
+            for i in range(len(todo)):
+                while True:
+                    # Waiting without a timeout would hold off Ctrl+C until
+                    # the next bag is done
+                    try:
+                        f, identity, info = results.next(INSPECT_POLL_INTERVAL)
+                        break
+                    except TimeoutError:
+                        pass
+                checkpoint.append(f, identity, info, checksum)
+            pool.close()
+            pool.join()
+        finally:
+            # Does not wait for bags still being inspected, their threads
+            # are daemons and their results are simply dropped
+            pool.terminate()
+            if cache is not None:
+                cache.save()
+        return checkpoint
+
+    def get_rosbag_info(self, path, checksum=None, jobs=None):
+        checkpoint = self.collect_rosbag_info(path, checksum=checksum, jobs=jobs)
+        res = dict(checkpoint.items())
+        checkpoint.remove()
         return res
 
 
-    def dict_to_yaml(self, data):
-        data['_metadata_info'] = {'creator': PROG, 'about': ABOUT,
+    def metadata_info(self):
+        return {'creator': PROG, 'about': ABOUT,
          'version': VERSION, 'url': URL, 'date': '%s' % datetime.datetime.now(),
          'path': self.target}
-        return yaml.dump(data)
+
+    def dict_to_yaml_chunks(self, data):
+        # Bag info held in a checkpoint is streamed from disk one bag at a
+        # time instead of being dumped with the rest of the data.
+        data['_metadata_info'] = self.metadata_info()
+        bags = data.get(BAGS_INFO_FIELD)
+        if not isinstance(bags, BagInfoCheckpoint):
+            yield yaml.dump(data)
+            return
+        yield yaml.dump(dict((k, v) for k, v in data.items() if k != BAGS_INFO_FIELD))
+        if len(bags) == 0:
+            yield '%s: {}\n' % BAGS_INFO_FIELD
+            return
+        yield '%s:\n' % BAGS_INFO_FIELD
+        for line in bags.to_yaml():
+            yield line
+
+    def dict_to_yaml(self, data):
+        return ''.join(self.dict_to_yaml_chunks(data))
+
+    def write_metadata_journal(self, filename, data, clean=False):
+        # Only fields that differ from the current state are appended. Fields
+        # are only removed when clean is set, as they may come from another
+        # writer.
+        data = dict((k, dict(v.items()) if isinstance(v, BagInfoCheckpoint) else v) for k, v in data.items())
+        current = journal.load(filename) or {}
+        changed = dict((k, v) for k, v in data.items() if current.get(k) != v)
+        changed[METADATA_INFO_FIELD] = self.metadata_info()
+        removed = []
+        if clean:
+            removed = [k for k in current if k not in changed and k not in data]
+        return journal.append(filename, set_fields=changed, unset_fields=removed)
 
     def write_metadata_file(self, filename, metadata_string, overwrite_existing=False):
 
@@ -73,14 +154,22 @@ class BagMetadataUtility(object):
                 overwrite_existing = query_yes_no("Overwrite existing file '%s'?" % filename, 'n')
             if not overwrite_existing:
                 return None
-        with open(filename,'w') as f:
-            f.write(metadata_string)
+        with journal.replacing(filename):
+            with open(filename,'w') as f:
+                if isinstance(metadata_string, dict):
+                    f.writelines(self.dict_to_yaml_chunks(metadata_string))
+                else:
+                    f.write(metadata_string)
         return (filename, )
 
-    def write_metadata(self, filename, metadata, overwrite_existing=False):
+    def write_metadata(self, filename, metadata, overwrite_existing=False, use_journal=False, clean=False):
 
-        if isinstance(metadata, dict): #convert dict to yaml
-            metadata = self.dict_to_yaml(metadata)
+        if use_journal and isinstance(metadata, dict) and not self.is_bag_file(filename):
+            if os.path.isdir(filename):
+                filename = os.path.join(filename, self.metadata_filename)
+            return self.write_metadata_journal(filename, metadata, clean=clean)
+
+        # dicts are converted to yaml while being written
 
         if os.path.isdir(filename):
             return self.write_metadata_file(os.path.join(filename, self.metadata_filename), metadata, overwrite_existing=overwrite_existing)
@@ -101,6 +190,8 @@ class BagMetadataUtility(object):
 
 
     def inject_to_bag(self, bagfile_name, metadata):
+        if isinstance(metadata, dict): #convert dict to yaml
+            metadata = self.dict_to_yaml(metadata)
         with rosbag.Bag(bagfile_name, 'a') as bag:
             metadata_msg = std_msgs.msg.String(data=metadata)
             if bag.get_message_count() == 0:
@@ -114,26 +205,44 @@ class BagMetadataUtility(object):
         path = os.path.dirname(bagfile_name)
         info = get_info(bagfile_name, freq=False)
 
-    def extract_from_bag(self, bagfile_name, use_yaml=True):
-        found = False
-        with rosbag.Bag(bagfile_name, 'r') as bag:
-            for msg_topic, msg, t in bag.read_messages(topics=[self.default_topic,]):
-                if msg_topic == self.default_topic:
-                    found = True
-                    break
-            if found:
+    def read_bag_metadata(self, bag, use_yaml=True):
+        for msg_topic, msg, t in bag.read_messages(topics=[self.default_topic,]):
+            if msg_topic == self.default_topic:
                 if use_yaml: # Try to parse data as yaml unless told not to
                     try:
-                        return (bagfile_name, yaml.load(msg.data))
+                        return yaml.load(msg.data)
                     except:
                         pass
-                return (bagfile_name, msg.data)
+                return msg.data
+        return None
+
+    def inspect(self, bagfile_name, use_yaml=True, info=True):
+        """Opens a bag once and returns its embedded metadata (None if there
+        is none) and, if info is set, its info (as get_info). Results are
+        kept while the file is unchanged, so extract, get_info and
+        get_full_info on the same bag only open it once. Info walks the whole
+        index, so it is only computed when asked for."""
+        key = (bagfile_name, tuple(file_identity(bagfile_name)), use_yaml)
+        res = self.inspected.get(key)
+        if res is None or (info and 'info' not in res):
+            with rosbag.Bag(bagfile_name, 'r') as bag:
+                if res is None:
+                    res = {'metadata': self.read_bag_metadata(bag, use_yaml=use_yaml)}
+                if info:
+                    res['info'] = yaml.load(bag._get_yaml_info())
+            self.inspected.put(key, res)
+        return res
+
+    def extract_from_bag(self, bagfile_name, use_yaml=True):
+        metadata = self.inspect(bagfile_name, use_yaml=use_yaml, info=False)['metadata']
+        if metadata is not None:
+            return (bagfile_name, metadata)
         return None
 
     def extract_from_dir(self, dirname, search_bags=True, find_all=False):
         res = []
         filename = os.path.join(dirname, self.metadata_filename)
-        if os.path.exists(filename):
+        if os.path.exists(filename) or journal.has_journal(filename):
             res.append(self.extract_from_file(filename))
             if not find_all:
                 return res
@@ -150,6 +259,9 @@ class BagMetadataUtility(object):
         return res
 
     def extract_from_file(self, filename):
+        if journal.has_journal(filename):
+            return (filename, journal.load(filename))
+
         # try reading the file
         with open(filename, 'r') as f:
             data = f.read()
@@ -159,6 +271,9 @@ class BagMetadataUtility(object):
     def extract(self, filename, use_yaml=True, find_all=False):
         res = []
 
+        if journal.has_journal(filename) and not os.path.exists(filename):
+            return [self.extract_from_file(filename)]
+
         if not os.path.exists(filename):
             return res
 
@@ -180,9 +295,19 @@ class BagMetadataUtility(object):
         return res
 
     def get_info(self, bagfile_name, freq=True):
-        b = rosbag.Bag(bagfile_name, 'r',skip_index=not freq)
-        return yaml.load(b._get_yaml_info())
+        if freq:
+            return self.inspect(bagfile_name)['info']
+        with rosbag.Bag(bagfile_name, 'r', skip_index=True) as b:
+            return yaml.load(b._get_yaml_info())
 
 
     def get_full_info(self, bagfile_name, freq=True):
-        return dict(self.get_info(bagfile_name, freq=freq).items() + self.extract(bagfile_name, use_yaml=True).items())
+        # Embedded metadata can only be read through the index, so the info
+        # comes from the same indexed open. Without freq, the frequencies are
+        # dropped to match what a skip_index open reports.
+        res = self.inspect(bagfile_name)
+        info = dict(res['info'])
+        if not freq and 'topics' in info:
+            info['topics'] = [dict((k, v) for k, v in t.items() if k != 'frequency') for t in info['topics']]
+        info['metadata'] = res['metadata']
+        return info
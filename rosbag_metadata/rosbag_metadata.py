@@ -34,6 +34,12 @@ from .utils import *
 from .metadata_writer import BagMetadataUtility
 from .system_info_collector import SystemInfoCollector
 from .config import *
+from . import export
+from . import journal
+from . import index
+from . import serve
+from . import diff
+from . import timeindex
 
 import ConfigParser
 
@@ -47,8 +53,21 @@ def print_once(s):
         print_once.d.add(s)
 
 
+# Subcommands, given as the first argument: rosbag_metadata <command> ...
+COMMANDS = {
+    'export': export.main,
+    'compact': journal.main,
+    'index': index.main,
+    'serve': serve.main,
+    'diff': diff.main,
+    'at': timeindex.main,
+}
+
 def main():
 
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        return COMMANDS[sys.argv[1]](sys.argv[2:])
+
     import argparse
     conf_parser = argparse.ArgumentParser(add_help=False)
     conf_parser.add_argument('-c', '--config', dest='config', type=str, help='Config file', default='~/.ros/rosbag_metadata.conf')
@@ -56,8 +75,8 @@ def main():
 
     bool_config_options = ('clean', 'write_rosbag_info', 'system_info', 'system_info_all', 'system_info_usb',
         'system_info_git', 'system_info_ros', 'system_info_env', 'system_info_full_env', 'system_info_ip', 'find_all',
-        'debug', 'ask_template_defaults', 'extra_fields')
-    allowed_config_options = bool_config_options + ('template',)
+        'debug', 'ask_template_defaults', 'extra_fields', 'journal')
+    allowed_config_options = bool_config_options + ('template', 'checksum', 'jobs')
 
     config = {}
     default_fields = DEFAULT_FIELDS
@@ -77,6 +96,8 @@ def main():
                 continue
             if k in bool_config_options:
                 config[k] = config_parser.getboolean('config',k)
+            if k == 'jobs':
+                config[k] = config_parser.getint('config',k)
 
         if config_parser.has_section('default_fields'):
             default_fields = dict(config_parser.items("default_fields"))
@@ -101,8 +122,10 @@ def main():
     writegroup.add_argument('-t', '--template', dest='template', type=str, help='')
     writegroup.add_argument('--clean', dest='clean', action='store_true', help='Do not read existing metadata, start fresh.')
     writegroup.add_argument('--write-rosbag-info', dest='write_rosbag_info', action='store_true', help="Runs 'rosbag info --freq' on each bag files in the directory and saves along with metadata (does not apply to bagfile targets)")
+    writegroup.add_argument('--checksum', dest='checksum', choices=CHECKSUM_MODES, default='none', help="Store a checksum of each bag file along with the rosbag info ('fingerprint' only hashes size, head and tail of the file). Results are cached in %s." % CHECKSUM_CACHE_FILENAME)
     writegroup.add_argument('--ask-template-defaults', dest='ask_template_defaults', action='store_true', help='Ask for values of fields defined in template even if they have a default value.')
     writegroup.add_argument('--no-extra-fields', dest='extra_fields', action='store_false', help='Do not prompt for extra fields.')
+    writegroup.add_argument('--journal', dest='journal', action='store_true', help='Append changed fields to the metadata journal (%s) instead of rewriting the metadata file. Safe with several concurrent writers.' % (METADATA_FILENAME + JOURNAL_SUFFIX))
     writegroup.add_argument('-y', '--yes', dest='no_prompt', action='store_true', help='Do not prompt for overwriting files.')
 
     systemgroup = parser.add_argument_group('System metadata options')
@@ -117,6 +140,7 @@ def main():
 
     # Both options
     parser.add_argument('-a', '--find-all', dest='find_all', action='store_true', help='Searches for all possible metadata for given path (only applies to directory targets)')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, help='Number of files to process in parallel')
     parser.add_argument('-d', '--debug', dest='debug', action='store_true', help='Output debug info')
     parser.add_argument('-v', '--version', action='version', version='rosbag_metadata %s' % VERSION)
 
@@ -228,7 +252,8 @@ def main():
         data[SYSTEM_INFO_FIELD] = SystemInfoCollector(**vars(args)).get_data()
 
     if args.write_rosbag_info and not bmu.is_bag_file(args.path):
-        data[BAGS_INFO_FIELD] = bmu.get_rosbag_info(args.path)
+        # Collected into a checkpoint file, so an interrupted run can resume
+        data[BAGS_INFO_FIELD] = bmu.collect_rosbag_info(args.path, checksum=args.checksum, jobs=args.jobs)
 
     # Prune data of empty keys
     for k in data.keys():
@@ -245,7 +270,10 @@ def main():
         overwrite_existing = True
     else:
         overwrite_existing = OVERWRITE_ASK
-    bmu.write_metadata(args.path, data, overwrite_existing=overwrite_existing)
+    written = bmu.write_metadata(args.path, data, overwrite_existing=overwrite_existing, use_journal=args.journal, clean=args.clean)
+
+    if written and BAGS_INFO_FIELD in data:
+        data[BAGS_INFO_FIELD].remove()
 
 if __name__ == '__main__':
     main()
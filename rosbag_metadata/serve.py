@@ -0,0 +1,236 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Hordur K. Heidarsson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import print_function
+
+import os
+import re
+import stat
+import json
+import argparse
+import threading
+import urlparse
+import Queue
+import SocketServer
+import BaseHTTPServer
+
+from .config import *
+from .utils import LRUCache
+from .checksum import file_identity
+from .metadata_writer import BagMetadataUtility
+from . import journal
+
+
+def path_identity(path, metadata_filename=METADATA_FILENAME):
+    """Identity of everything a lookup on path depends on. For directories
+    this is the metadata file, its journal and every bag in it."""
+    if not os.path.isdir(path):
+        files = [path, journal.journal_filename(path)]
+    else:
+        files = [os.path.join(path, metadata_filename)]
+        files.append(journal.journal_filename(files[0]))
+        files.extend(os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith('.bag'))
+    res = []
+    for f in files:
+        try:
+            res.append((f, tuple(file_identity(f))))
+        except OSError:
+            pass
+    return tuple(res)
+
+def _flag(query, name, default):
+    value = query.get(name, [None])[0]
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+
+class AccessDenied(Exception):
+    pass
+
+
+class MetadataService(object):
+    def __init__(self, cache_size=SERVE_CACHE_SIZE, root=None, **kwargs):
+        self.bmu = BagMetadataUtility(None, **kwargs)
+        self.root = root and os.path.realpath(root)
+        self.cache = LRUCache(cache_size)
+        self.methods = {
+            'extract': lambda path, q: self.bmu.extract(path, find_all=_flag(q, 'find_all', False)),
+            'get_info': lambda path, q: self.bmu.get_info(path, freq=_flag(q, 'freq', True)),
+            'get_full_info': lambda path, q: self.bmu.get_full_info(path, freq=_flag(q, 'freq', True)),
+        }
+
+    def call(self, method, query):
+        path = os.path.abspath(os.path.expanduser(query['path'][0]))
+        if self.root and not os.path.join(os.path.realpath(path), '').startswith(os.path.join(self.root, '')):
+            raise AccessDenied("'%s' is outside of %s" % (path, self.root))
+        if not os.path.exists(path) and not journal.has_journal(path):
+            raise IOError("No such file or directory: '%s'" % path)
+        key = (method, path, tuple(sorted((k, tuple(v)) for k, v in query.items())), path_identity(path))
+        res = self.cache.get(key)
+        if res is None:
+            res = self.methods[method](path, query)
+            self.cache.put(key, res)
+        return res
+
+
+class MetadataRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """GET /<method>?path=<path>[&option=value] returns the result as json."""
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        method = url.path.strip('/')
+        query = urlparse.parse_qs(url.query)
+        service = self.server.service
+
+        if not self.host_allowed():
+            return self.send_json(403, {'error': 'Host not allowed'})
+        if method == 'stats':
+            return self.send_json(200, {'hits': service.cache.hits, 'misses': service.cache.misses, 'size': len(service.cache.data)})
+        if method not in service.methods:
+            return self.send_json(404, {'error': 'Unknown method %s' % method})
+        if 'path' not in query:
+            return self.send_json(400, {'error': 'Missing path parameter'})
+        try:
+            return self.send_json(200, service.call(method, query))
+        except AccessDenied as e:
+            return self.send_json(403, {'error': '%s' % e})
+        except IOError as e:
+            return self.send_json(404, {'error': '%s' % e})
+        except Exception as e:
+            return self.send_json(500, {'error': '%s' % e})
+
+    def host_allowed(self):
+        # Browsers send the name they resolved in Host, so checking it keeps
+        # DNS rebinding pages from reading files through the service
+        allowed = self.server.allowed_hosts
+        if allowed is None:
+            return True
+        m = re.match(r'^\[?([^\]]*?)\]?(:\d+)?$', self.headers.getheader('Host') or '')
+        return m is not None and m.group(1).lower() in allowed
+
+    def send_json(self, code, data):
+        body = json.dumps(data, default=str)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix sockets have no client address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class ThreadPoolMixIn:
+    """Handles requests on a fixed number of threads instead of starting a
+    thread per request like SocketServer.ThreadingMixIn."""
+    threads = SERVE_THREADS
+
+    def start_pool(self):
+        self.requests = Queue.Queue(self.threads * 4)
+        for i in range(self.threads):
+            t = threading.Thread(target=self.process_request_pool)
+            t.daemon = True
+            t.start()
+
+    def process_request_pool(self):
+        while True:
+            request, client_address = self.requests.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        self.requests.put((request, client_address))
+
+
+class MetadataHTTPServer(ThreadPoolMixIn, BaseHTTPServer.HTTPServer):
+    allow_reuse_address = True
+
+class MetadataUnixHTTPServer(ThreadPoolMixIn, SocketServer.UnixStreamServer):
+    def server_bind(self):
+        remove_socket(self.server_address)
+        SocketServer.UnixStreamServer.server_bind(self)
+        # Attributes BaseHTTPRequestHandler expects from an HTTPServer
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+def remove_socket(path):
+    """Removes a stale unix socket, but never any other kind of file."""
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def make_server(service, host=SERVE_HOST, port=SERVE_PORT, socket_path=None, threads=SERVE_THREADS, verbose=False, allowed_hosts=()):
+    if socket_path:
+        # Not reachable from browsers, so the Host header is not checked
+        server = MetadataUnixHTTPServer(socket_path, MetadataRequestHandler)
+        server.allowed_hosts = None
+    else:
+        server = MetadataHTTPServer((host, port), MetadataRequestHandler)
+        server.allowed_hosts = set(h.lower() for h in SERVE_ALLOWED_HOSTS + (host, ) + tuple(allowed_hosts))
+    server.service = service
+    server.verbose = verbose
+    server.threads = threads
+    server.start_pool()
+    return server
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='rosbag_metadata serve', description='Serve extract, get_info and get_full_info over HTTP, e.g. GET /get_info?path=/data/my.bag')
+    parser.add_argument('--host', dest='host', type=str, default=SERVE_HOST, help='Address to listen on')
+    parser.add_argument('-p', '--port', dest='port', type=int, default=SERVE_PORT, help='Port to listen on')
+    parser.add_argument('-s', '--socket', dest='socket', type=str, help='Listen on a unix socket instead of a port')
+    parser.add_argument('--allow-host', dest='allowed_hosts', action='append', default=[], help='Also accept requests for this host name (default: only %s and --host)' % ', '.join(SERVE_ALLOWED_HOSTS))
+    parser.add_argument('-r', '--root', dest='root', type=str, help='Only serve paths below this directory')
+    parser.add_argument('-j', '--threads', dest='threads', type=int, default=SERVE_THREADS, help='Number of request handler threads')
+    parser.add_argument('--cache-size', dest='cache_size', type=int, default=SERVE_CACHE_SIZE, help='Number of results to keep cached')
+    parser.add_argument('-d', '--debug', dest='debug', action='store_true', help='Log requests')
+    args = parser.parse_args(argv)
+
+    socket_path = args.socket and os.path.abspath(os.path.expanduser(args.socket))
+    root = args.root and os.path.abspath(os.path.expanduser(args.root))
+    server = make_server(MetadataService(cache_size=args.cache_size, root=root), host=args.host, port=args.port,
+        socket_path=socket_path, threads=args.threads, verbose=args.debug, allowed_hosts=args.allowed_hosts)
+    print('Serving metadata on %s' % (socket_path or 'http://%s:%d' % (args.host, args.port)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path:
+            remove_socket(socket_path)
@@ -29,8 +29,7 @@
 
 import os
 import rospkg
-from rospkg.common import PACKAGE_FILE
-from rospkg.rospack import ManifestManager
+from rospkg.common import PACKAGE_FILE, MANIFEST_FILE
 import platform
 import re
 import subprocess
@@ -38,6 +37,11 @@ import git
 import datetime
 import socket
 import netifaces
+import threading
+import xml.parsers.expat
+from multiprocessing.pool import ThreadPool
+
+from .utils import byteify
 
 # http://stackoverflow.com/questions/8110310/simple-way-to-query-connected-usb-devices-info-in-python
 def get_usb_devices():
@@ -53,6 +57,72 @@ def get_usb_devices():
                 devices.append(dinfo)
     return devices
 
+def find_ros_manifests(paths):
+    """Crawls each path for package manifests the same way rospkg does.
+    Returns one list of manifest filenames per path."""
+    res = []
+    for path in paths:
+        found = []
+        for d, dirs, files in os.walk(os.path.abspath(path), topdown=True, followlinks=True):
+            if 'CATKIN_IGNORE' in files:
+                del dirs[:]
+                continue
+            for manifest in (PACKAGE_FILE, MANIFEST_FILE):
+                if manifest in files:
+                    found.append(os.path.join(d, manifest))
+                    del dirs[:]
+                    break
+            else:
+                if 'rospack_nosubdirs' in files:
+                    del dirs[:]
+                # Skip hidden directories (.git, .svn, ...)
+                dirs[:] = [di for di in dirs if di[0] != '.']
+        res.append(found)
+    return res
+
+class _ManifestDone(Exception):
+    pass
+
+def read_package_manifest(filename, chunk_size=4096):
+    """Returns (name, version) from a package.xml. The file is fed to expat
+    in small chunks and parsing stops as soon as both top level elements
+    have been seen, so the dependency lists are usually never read."""
+    found = {}
+    state = {'depth': 0, 'text': None}
+
+    def start(tag, attrs):
+        state['depth'] += 1
+        if state['depth'] == 2 and tag in ('name', 'version'):
+            state['text'] = []
+
+    def end(tag):
+        if state['depth'] == 2 and state['text'] is not None:
+            found[tag] = ''.join(state['text']).strip() or None
+            state['text'] = None
+            if len(found) == 2:
+                raise _ManifestDone()
+        state['depth'] -= 1
+
+    def data(text):
+        if state['text'] is not None:
+            state['text'].append(text)
+
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = data
+    try:
+        with open(filename, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                parser.Parse(chunk, not chunk)
+                if not chunk:
+                    break
+    except (_ManifestDone, xml.parsers.expat.ExpatError, IOError):
+        pass
+    # expat returns unicode, which yaml.dump would tag as !!python/unicode
+    return (byteify(found.get('name')), byteify(found.get('version')))
+
 def get_ip_info():
     res = {}
     for iface in netifaces.interfaces():
@@ -60,7 +130,7 @@ def get_ip_info():
     return res
 
 class SystemInfoCollector():
-    def __init__(self, system_info_all=True, system_info_usb=True, system_info_git=True, system_info_ros=True, system_info_env=True, system_info_full_env=False, system_info_ip=True, **kwargs):
+    def __init__(self, system_info_all=True, system_info_usb=True, system_info_git=True, system_info_ros=True, system_info_env=True, system_info_full_env=False, system_info_ip=True, jobs=None, **kwargs):
 
         self.use_usb = system_info_usb or system_info_all
         self.use_git = system_info_git or system_info_all
@@ -69,30 +139,43 @@ class SystemInfoCollector():
         self.use_full_env = system_info_full_env or system_info_all
         self.use_ip = system_info_ip or system_info_all
 
-        self.rospack = rospkg.RosPack()
+        self.jobs = jobs or 8
+
         self.rosstack = rospkg.RosStack()
-        self.mm = ManifestManager(PACKAGE_FILE)
+        self.rosstack_lock = threading.Lock()
+
+    def read_ros_manifest(self, manifest):
+        if os.path.basename(manifest) == PACKAGE_FILE:
+            return read_package_manifest(manifest)
 
-    def get_ros_package_version(self, stack_name):
-        # copied from https://github.com/ros-infrastructure/rospkg/blob/master/scripts/rosversion
+        # Dry packages have no version of their own, try the stack
+        name = os.path.basename(os.path.dirname(manifest))
         try:
-            version = self.rosstack.get_stack_version(stack_name)
-        except rospkg.ResourceNotFound as e:
-            try:
-                # hack to make it work with wet packages
-                path = self.mm.get_path(stack_name)
-                package_manifest = os.path.join(path, 'package.xml')
-                if os.path.exists(package_manifest):
-                    from xml.etree.ElementTree import ElementTree
-                    try:
-                        root = ElementTree(None, package_manifest)
-                        version = root.findtext('version')
-                        return version
-                    except Exception:
-                        pass
-            except rospkg.ResourceNotFound as e:
-                return None
-        return None
+            with self.rosstack_lock:
+                return (name, self.rosstack.get_stack_version(name))
+        except rospkg.ResourceNotFound:
+            return (name, None)
+
+    def get_ros_package_versions(self):
+        manifests = find_ros_manifests(rospkg.get_ros_paths())
+        all_manifests = sum(manifests, [])
+        pool = ThreadPool(max(1, min(self.jobs, len(all_manifests))))
+        try:
+            parsed = dict(zip(all_manifests, pool.map(self.read_ros_manifest, all_manifests)))
+        finally:
+            pool.terminate()
+            pool.join()
+
+        # Packages found earlier in the package path take precedence
+        res = {}
+        for found in reversed(manifests):
+            seen = set()
+            for m in found:
+                name, version = parsed[m]
+                if name is not None and name not in seen:
+                    seen.add(name)
+                    res[name] = version
+        return res
 
     def get_git_repo_info(self, path):
         res = {}
@@ -132,14 +215,10 @@ class SystemInfoCollector():
     def get_ros_info(self):
         res = {}
 
-        rospack = rospkg.RosPack()
-
         if 'ROS_DISTRO' in os.environ:
             res['distro_name'] = os.environ['ROS_DISTRO']
 
-        res['package_versions'] = {}
-        for p in rospack.list():
-            res['package_versions'][p] = self.get_ros_package_version(p)
+        res['package_versions'] = self.get_ros_package_versions()
 
         if self.use_git:
             res['git'] = self.find_git_repos(os.environ['ROS_PACKAGE_PATH'].split(':'))
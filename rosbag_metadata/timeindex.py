@@ -0,0 +1,284 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Hordur K. Heidarsson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import argparse
+import datetime
+from multiprocessing.pool import ThreadPool
+
+import yaml
+
+from .config import *
+from .utils import split_bagname, byteify
+from .checksum import file_identity
+
+
+class IntervalIndex(object):
+    """Static interval tree over intervals sorted by start.
+
+    The sorted array is treated as an implicit balanced tree where the node
+    for a range [lo, hi) is its middle element. max_end[mid] holds the
+    largest end in that range, so subtrees that end before the query are
+    skipped. Queries take O(log n + k) for k matches.
+    """
+    def __init__(self, intervals):
+        self.intervals = sorted(intervals)
+        self.max_end = [None] * len(self.intervals)
+        self._build(0, len(self.intervals))
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        res = self.intervals[mid][1]
+        for child in (self._build(lo, mid), self._build(mid + 1, hi)):
+            if child is not None and child > res:
+                res = child
+        self.max_end[mid] = res
+        return res
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def query(self, start, end=None):
+        """Returns (start, end, key) of all intervals overlapping
+        [start, end], ordered by start."""
+        if end is None:
+            end = start
+        res = []
+        self._query(0, len(self.intervals), start, end, res)
+        return res
+
+    def _query(self, lo, hi, start, end, res):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        if self.max_end[mid] < start:
+            return
+        self._query(lo, mid, start, end, res)
+        interval = self.intervals[mid]
+        if interval[0] <= end:
+            if interval[1] >= start:
+                res.append(interval)
+            self._query(mid + 1, hi, start, end, res)
+
+
+def bagname_time(filename):
+    """Start time from the date in a bag name, in local time as recorded."""
+    try:
+        date = split_bagname(filename)[2]
+        return time.mktime(time.strptime(date, '%Y-%m-%d-%H-%M-%S'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class BagTimeIndex(object):
+    """Start and end times of all bags below root, persisted as json in
+    root. update() only inspects bags that are new or have changed."""
+    def __init__(self, root, filename=TIME_INDEX_FILENAME, bmu=None):
+        self.root = root
+        self.filename = os.path.join(root, filename)
+        if bmu is None:
+            # Imported here so the index itself can be used without ROS
+            from .metadata_writer import BagMetadataUtility
+            bmu = BagMetadataUtility(root)
+        self.bmu = bmu
+        self.bags = {}
+        self.tree = None
+        if os.path.exists(self.filename):
+            with open(self.filename, 'r') as f:
+                bags = byteify(json.load(f)).get('bags', {})
+            # Paths are kept as utf-8 str, as os.walk returns them
+            self.bags = dict((rel.encode('utf-8'), e) for rel, e in bags.items())
+
+    def save(self):
+        tmp = '%s.%s.tmp' % (self.filename, uuid.uuid4().hex)
+        with open(tmp, 'w') as f:
+            json.dump({'version': 1, 'bags': self.bags}, f)
+        os.rename(tmp, self.filename)
+
+    def stored_bag_info(self, dirname):
+        """Bag info saved with --write-rosbag-info, to avoid opening bags."""
+        filename = os.path.join(dirname, self.bmu.metadata_filename)
+        if not os.path.exists(filename):
+            return {}
+        data = self.bmu.extract_from_file(filename)[1]
+        if not isinstance(data, dict):
+            return {}
+        return data.get(BAGS_INFO_FIELD) or {}
+
+    def bag_times(self, path, stored):
+        info = stored.get(os.path.basename(path))
+        if not info or info.get('start') is None:
+            try:
+                info = self.bmu.get_info(path)
+            except Exception:
+                info = {}
+        start, end = info.get('start'), info.get('end')
+        if start is None:
+            start = end = bagname_time(path)
+        return (start, end if end is not None else start)
+
+    def update(self, jobs=None):
+        """Brings the index up to date with the bags on disk. Returns True if
+        anything changed."""
+        found = {}
+        todo = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()
+            for f in filenames:
+                if not f.endswith('.bag'):
+                    continue
+                path = os.path.join(dirpath, f)
+                rel = os.path.relpath(path, self.root)
+                try:
+                    identity = file_identity(path)
+                except OSError:
+                    continue
+                entry = self.bags.get(rel)
+                if entry is not None and entry['identity'] == identity:
+                    found[rel] = entry
+                else:
+                    todo.append((rel, path, identity))
+
+        stored = {}
+        def work(item):
+            rel, path, identity = item
+            dirname = os.path.dirname(path)
+            if dirname not in stored:
+                stored[dirname] = self.stored_bag_info(dirname)
+            start, end = self.bag_times(path, stored[dirname])
+            return (rel, {'identity': identity, 'start': start, 'end': end})
+
+        pool = ThreadPool(max(1, min(jobs or 1, len(todo))))
+        try:
+            found.update(pool.map(work, todo))
+        finally:
+            pool.terminate()
+            pool.join()
+
+        changed = len(todo) > 0 or len(found) != len(self.bags)
+        self.bags = found
+        self.tree = None
+        return changed
+
+    def query(self, start, end=None):
+        if self.tree is None:
+            self.tree = IntervalIndex((e['start'], e['end'], rel) for rel, e in self.bags.items() if e['start'] is not None)
+        return [(os.path.join(self.root, rel), s, e) for s, e, rel in self.tree.query(start, end)]
+
+
+TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d-%H-%M-%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+TIME_OF_DAY_RE = re.compile(r'^\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?$')
+
+def parse_time(s, date=None):
+    """Parses a unix time, a local date and time, or a time of day on the
+    given date (today by default)."""
+    s = s.strip()
+    try:
+        return float(s)
+    except ValueError:
+        pass
+    if TIME_OF_DAY_RE.match(s):
+        s = '%s %s' % (date or datetime.date.today().isoformat(), s)
+    fraction = 0.0
+    m = re.match(r'^(.*:\d{2})(\.\d+)$', s)
+    if m:
+        s, fraction = m.group(1), float(m.group(2))
+    for fmt in TIME_FORMATS:
+        try:
+            return time.mktime(time.strptime(s, fmt)) + fraction
+        except ValueError:
+            pass
+    raise ValueError("Could not parse time '%s'" % s)
+
+def parse_range(s, date=None):
+    """Parses 'TIME' or 'TIME..TIME'. A time of day after the separator is
+    taken on the same date as the first time, or the next day if it is
+    earlier (23:59..00:05)."""
+    parts = re.split(r'\.\.|/|\xe2\x80\x93', s)
+    if len(parts) > 2:
+        raise ValueError("Could not parse range '%s'" % s)
+    start = parse_time(parts[0], date=date)
+    if len(parts) == 1:
+        return (start, start)
+    day = datetime.date.fromtimestamp(start)
+    end = parse_time(parts[1], date=day.isoformat())
+    if end < start:
+        if not TIME_OF_DAY_RE.match(parts[1].strip()):
+            raise ValueError("Range '%s' ends before it starts" % s)
+        end = parse_time(parts[1], date=(day + datetime.timedelta(days=1)).isoformat())
+    return (start, end)
+
+def format_time(t):
+    return datetime.datetime.fromtimestamp(t).isoformat(' ')
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='rosbag_metadata at', description='Find bags recorded at a time or during a time range.')
+    parser.add_argument('time', type=str, help="Time or range, e.g. '2015-06-01 14:03:12', '14:03:12..14:05:00' or a unix time")
+    parser.add_argument('root', type=str, help='Directory to search')
+    parser.add_argument('--date', dest='date', type=str, help='Date (YYYY-MM-DD) for times without a date (default: today)')
+    parser.add_argument('-u', '--update', dest='update', action='store_true', help='Look for new or changed bags before searching (the index is always built if there is none yet)')
+    parser.add_argument('--no-metadata', dest='metadata', action='store_false', help='Only list the bags')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, help='Number of bags to inspect in parallel when updating the index')
+    args = parser.parse_args(argv)
+
+    try:
+        start, end = parse_range(args.time, date=args.date)
+    except ValueError as e:
+        print(e)
+        return 2
+
+    root = os.path.abspath(os.path.expanduser(args.root))
+    index = BagTimeIndex(root)
+    if (args.update or not os.path.exists(index.filename)) and index.update(jobs=args.jobs):
+        try:
+            index.save()
+        except (IOError, OSError) as e:
+            # e.g. a read-only archive; the index is still usable in memory
+            print('Could not save time index to %s: %s' % (index.filename, e), file=sys.stderr)
+
+    matches = index.query(start, end)
+    if not matches:
+        print('No bags found between %s and %s' % (format_time(start), format_time(end)))
+        return 1
+
+    for path, s, e in matches:
+        res = {'start': format_time(s), 'end': format_time(e)}
+        if args.metadata:
+            try:
+                found = index.bmu.extract(path) or index.bmu.extract(os.path.dirname(path))
+            except Exception as e:
+                print('Could not read metadata for %s: %s' % (path, e), file=sys.stderr)
+                found = None
+            if found and isinstance(found[0][1], dict):
+                res['metadata'] = dict((k, v) for k, v in found[0][1].items() if k not in SYSTEM_FIELDS)
+        print(yaml.dump({path: res}, default_flow_style=False))
+    return 0
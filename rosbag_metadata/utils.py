@@ -21,7 +21,10 @@
 # SOFTWARE.
 
 import os
+import re
 import sys
+import threading
+import collections
 
 # http://code.activestate.com/recipes/577098/
 def command_line_query(question, default=None, validate=None, style="compact"):
@@ -175,3 +178,55 @@ def make_bagname(path, prefix, date, seq=None):
         res = res + '_' + seq
     res = res + '.bag'
     return os.path.join(path, res)
+
+def flatten_dict(d, prefix='', sep='.'):
+    """Flatten nested dicts into a single level dict with joined keys.
+    Lists and other values are kept as leaves."""
+    res = {}
+    for k, v in d.items():
+        key = '%s%s%s' % (prefix, sep, k) if prefix else '%s' % k
+        if isinstance(v, dict) and len(v) > 0:
+            res.update(flatten_dict(v, key, sep=sep))
+        else:
+            res[key] = v
+    return res
+
+def byteify(data):
+    """Converts the unicode strings json.loads returns to str where they are
+    plain ascii, as yaml.load does, so yaml.dump writes them without tags."""
+    if isinstance(data, unicode):
+        try:
+            return data.encode('ascii')
+        except UnicodeEncodeError:
+            return data
+    if isinstance(data, list):
+        return [byteify(v) for v in data]
+    if isinstance(data, dict):
+        return dict((byteify(k), byteify(v)) for k, v in data.items())
+    return data
+
+class LRUCache(object):
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.data = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            try:
+                value = self.data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.data[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = value
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
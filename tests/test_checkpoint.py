@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import yaml
+
+from rosbag_metadata.checkpoint import BagInfoCheckpoint
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'checkpoint')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_torn_line_is_dropped(self):
+        c = BagInfoCheckpoint(self.filename)
+        c.append('a.bag', [1, 2], {'messages': 1})
+        c.append('b.bag', [1, 3], {'messages': 2})
+        size = os.path.getsize(self.filename)
+        with open(self.filename, 'a') as f:
+            f.write('{"bag": "c.bag", "ide')
+
+        c = BagInfoCheckpoint(self.filename)
+        self.assertEqual(len(c), 2)
+        self.assertEqual(os.path.getsize(self.filename), size)
+        c.append('c.bag', [1, 4], {'messages': 3})
+        c = BagInfoCheckpoint(self.filename)
+        self.assertEqual([name for name, info in c.items()], ['a.bag', 'b.bag', 'c.bag'])
+
+    def test_is_done(self):
+        c = BagInfoCheckpoint(self.filename)
+        c.append('a.bag', [1, 2], {'messages': 1}, 'fast')
+        c = BagInfoCheckpoint(self.filename)
+        self.assertTrue(c.is_done('a.bag', [1, 2], 'fast'))
+        self.assertFalse(c.is_done('a.bag', [1, 5], 'fast'))
+        self.assertFalse(c.is_done('a.bag', [1, 2], 'full'))
+        self.assertFalse(c.is_done('a.bag', [1, 2]))
+        self.assertFalse(c.is_done('b.bag', [1, 2], 'fast'))
+
+    def test_latest_entry_wins(self):
+        c = BagInfoCheckpoint(self.filename)
+        c.append('a.bag', [1, 2], {'messages': 1})
+        c.append('a.bag', [1, 3], {'messages': 2})
+        c = BagInfoCheckpoint(self.filename)
+        self.assertEqual(list(c.items()), [('a.bag', {'messages': 2})])
+
+    def test_to_yaml_round_trip(self):
+        bags = {'a.bag': {'messages': 1, 'topics': [{'topic': u'/caf\xe9', 'type': 'std_msgs/String'}]},
+                'b.bag': {'messages': 2, 'topics': []}}
+        c = BagInfoCheckpoint(self.filename)
+        for name in sorted(bags):
+            c.append(name, [1, 2], bags[name])
+        text = 'bags:\n' + ''.join(c.to_yaml())
+        self.assertNotIn('!!python', text)
+        loaded = yaml.safe_load(text)['bags']
+        self.assertEqual(loaded['b.bag'], bags['b.bag'])
+        self.assertEqual(loaded['a.bag']['topics'][0]['topic'], u'/caf\xe9')
+
+if __name__ == '__main__':
+    unittest.main()
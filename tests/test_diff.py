@@ -0,0 +1,21 @@
+import unittest
+
+from rosbag_metadata import diff
+
+class DiffTest(unittest.TestCase):
+    def changes(self, a, b):
+        return list(diff.diff_trees(a, diff.hash_tree(a), b, diff.hash_tree(b)))
+
+    def test_equal_numbers_are_unchanged(self):
+        a = {'count': 1, 'sizes': [2, 3], 'name': u'bag'}
+        b = {'count': 1L, 'sizes': [2L, 3], 'name': 'bag'}
+        self.assertEqual(self.changes(a, b), [])
+
+    def test_changed_values_are_reported(self):
+        a = {'count': 1, 'flag': True, 'op': {'name': 'bob'}}
+        b = {'count': 1, 'flag': 1, 'op': {'name': 'alice'}}
+        self.assertEqual(sorted(p for p, old, new in self.changes(a, b)),
+                         [('flag',), ('op', 'name')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+from rosbag_metadata.index import WorkQueue
+
+def claim_all(path):
+    queue = WorkQueue(path)
+    res = []
+    while True:
+        claimed = queue.claim_next()
+        if claimed is None or claimed[0] is None:
+            return res
+        queue.finish(claimed[0], {'path': queue.shard(claimed[0])})
+        res.append(claimed[0])
+
+class WorkQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.queue = WorkQueue(self.dir, lease_time=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_claim(self):
+        task_id = self.queue.add('/data/a')
+        self.assertEqual(self.queue.add('/data/a'), task_id)
+        self.assertIsNotNone(self.queue.claim(task_id))
+        # Leased by a live worker
+        self.assertIsNone(WorkQueue(self.dir, lease_time=60).claim(task_id))
+        self.assertEqual(self.queue.claim_next(), (None, None))
+        self.queue.finish(task_id, {'path': '/data/a'})
+        self.assertIsNone(self.queue.claim_next())
+        self.assertEqual(list(self.queue.results()), [{'path': '/data/a'}])
+
+    def test_expired_lease_is_reclaimed(self):
+        task_id = self.queue.add('/data/a')
+        lease = self.queue.claim(task_id)
+        old = self.queue.now() - 120
+        os.utime(lease, (old, old))
+
+        other = WorkQueue(self.dir, lease_time=60)
+        new_lease = other.claim(task_id)
+        self.assertIsNotNone(new_lease)
+        self.assertNotEqual(new_lease, lease)
+        self.assertEqual(other.current_lease(task_id), 1)
+        # Only one worker wins the next generation
+        self.assertIsNone(WorkQueue(self.dir, lease_time=60).claim(task_id))
+
+    def test_non_ascii_shard(self):
+        task_id = self.queue.add('/data/caf\xc3\xa9')
+        self.assertEqual(self.queue.shard(task_id), '/data/caf\xc3\xa9')
+
+    def test_processes_share_queue(self):
+        for i in range(40):
+            self.queue.add('/data/%d' % i)
+        pool = multiprocessing.Pool(4)
+        try:
+            claimed = sum(pool.map(claim_all, [self.dir] * 4), [])
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(sorted(claimed), self.queue.tasks())
+        self.assertEqual(len(self.queue.done()), 40)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from rosbag_metadata import journal
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'metadata.yaml')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_append_and_load(self):
+        journal.append(self.filename, set_fields={'a': 1, 'b': 'x'})
+        journal.append(self.filename, set_fields={'b': 'y'}, unset_fields=['a'])
+        self.assertEqual(journal.load(self.filename), {'b': 'y'})
+
+    def test_torn_write_keeps_later_records(self):
+        journal.append(self.filename, set_fields={'a': 1})
+        with open(journal.journal_filename(self.filename), 'a') as f:
+            f.write('{"set": {"b"')
+        journal.append(self.filename, set_fields={'c': 3})
+        journal.append(self.filename, set_fields={'d': 4})
+        self.assertEqual(journal.load(self.filename), {'a': 1, 'c': 3, 'd': 4})
+
+        journal.compact(self.filename)
+        self.assertEqual(os.path.getsize(journal.journal_filename(self.filename)), 0)
+        self.assertEqual(journal.load(self.filename), {'a': 1, 'c': 3, 'd': 4})
+
+    def test_compact_writes_plain_strings(self):
+        journal.append(self.filename, set_fields={'a': 'x'})
+        journal.compact(self.filename)
+        with open(self.filename) as f:
+            self.assertNotIn('!!python', f.read())
+
+    def test_replacing_discards_old_records(self):
+        journal.append(self.filename, set_fields={'description': 'old'})
+        with journal.replacing(self.filename):
+            with open(self.filename, 'w') as f:
+                f.write('description: new\n')
+        self.assertEqual(journal.load(self.filename), {'description': 'new'})
+
+if __name__ == '__main__':
+    unittest.main()
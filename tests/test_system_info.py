@@ -0,0 +1,39 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import yaml
+
+from rosbag_metadata.system_info_collector import read_package_manifest
+
+PACKAGE_XML = '''<?xml version="1.0"?>
+<package format="2">
+  <name>foo_driver</name>
+  <version>1.2.3</version>
+  <description>Caf\xc3\xa9 driver</description>
+  <depend>roscpp</depend>
+</package>
+'''
+
+class PackageManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'package.xml')
+        with open(self.filename, 'w') as f:
+            f.write(PACKAGE_XML)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_name_and_version(self):
+        self.assertEqual(read_package_manifest(self.filename), ('foo_driver', '1.2.3'))
+
+    def test_dumps_plain_strings(self):
+        name, version = read_package_manifest(self.filename)
+        dumped = yaml.dump({'ros': {name: version}})
+        self.assertNotIn('!!python', dumped)
+        self.assertEqual(yaml.safe_load(dumped), {'ros': {'foo_driver': '1.2.3'}})
+
+if __name__ == '__main__':
+    unittest.main()
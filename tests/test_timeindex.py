@@ -0,0 +1,48 @@
+import time
+import random
+import datetime
+import unittest
+
+from rosbag_metadata.timeindex import IntervalIndex, parse_range
+
+class IntervalIndexTest(unittest.TestCase):
+    def test_matches_brute_force(self):
+        rnd = random.Random(1)
+        for n in (0, 1, 2, 7, 100):
+            intervals = []
+            for i in range(n):
+                start = rnd.uniform(0, 1000)
+                intervals.append((start, start + rnd.expovariate(1 / 50.0), i))
+            index = IntervalIndex(intervals)
+            self.assertEqual(len(index), n)
+            for q in range(200):
+                start = rnd.uniform(-100, 1100)
+                end = start + rnd.choice([0, rnd.uniform(0, 200)])
+                expected = sorted(iv for iv in intervals if iv[0] <= end and iv[1] >= start)
+                self.assertEqual(index.query(start, end), expected)
+
+    def test_point_query_includes_bounds(self):
+        index = IntervalIndex([(10, 20, 'a'), (20, 30, 'b'), (31, 40, 'c')])
+        self.assertEqual(index.query(20), [(10, 20, 'a'), (20, 30, 'b')])
+        self.assertEqual(index.query(30.5), [])
+
+
+class ParseRangeTest(unittest.TestCase):
+    def local(self, *args):
+        return time.mktime(datetime.datetime(*args).timetuple())
+
+    def test_time_of_day_range(self):
+        self.assertEqual(parse_range('14:03..14:05', date='2015-06-01'),
+                         (self.local(2015, 6, 1, 14, 3), self.local(2015, 6, 1, 14, 5)))
+
+    def test_range_across_midnight(self):
+        self.assertEqual(parse_range('23:59..00:05', date='2015-06-01'),
+                         (self.local(2015, 6, 1, 23, 59), self.local(2015, 6, 2, 0, 5)))
+        self.assertEqual(parse_range('2015-06-01 23:59..00:05'),
+                         (self.local(2015, 6, 1, 23, 59), self.local(2015, 6, 2, 0, 5)))
+
+    def test_reversed_dates_are_rejected(self):
+        self.assertRaises(ValueError, parse_range, '2015-06-02..2015-06-01')
+
+if __name__ == '__main__':
+    unittest.main()